@@ -2,18 +2,258 @@ import asyncio
 import json
 import os
 import ssl
+import time
 import websockets
 import aiohttp
 import aiomysql
 from urllib.parse import urlparse, parse_qs
-from typing import Dict, Optional
-from dataclasses import dataclass
-from datetime import datetime
+from typing import Deque, Dict, Optional, Set
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, date, timedelta
 
 @dataclass
 class UserSession:
     token: str
     username: str
+    authenticated_at: float = field(default_factory=time.monotonic)
+
+@dataclass
+class CircuitBreaker:
+    """Circuit breaker для API авторизации: closed -> open -> half_open -> closed"""
+    failure_threshold: int
+    reset_timeout: float
+    state: str = "closed"
+    failures: int = 0
+    opened_at: float = 0.0
+    probing: bool = False
+
+    def allow_request(self) -> bool:
+        """Разрешает запрос к API; в состоянии half_open пропускает только одну пробу"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+            print(f"[AUTH] Circuit breaker half-open, probing auth API")
+        if self.state == "half_open":
+            if self.probing:
+                return False
+            self.probing = True
+        return True
+
+    def record_success(self):
+        if self.state != "closed":
+            print(f"[AUTH] Circuit breaker closed")
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def release(self):
+        """Освобождает пробу half_open без учета результата (например, при отмене запроса)"""
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"[AUTH] Circuit breaker open after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+@dataclass
+class LatencyStats:
+    """Статистика задержек запросов к API авторизации"""
+    window: int = 1000
+    count: int = 0
+    errors: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    recent: Deque[float] = None
+
+    def __post_init__(self):
+        self.recent = deque(maxlen=self.window)
+
+    def record(self, latency: float, ok: bool = True):
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        self.recent.append(latency)
+
+    def snapshot(self) -> dict:
+        """Сводка в миллисекундах; перцентили считаются по последним запросам"""
+        ordered = sorted(self.recent)
+        def percentile(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000 if ordered else 0.0
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total / self.count * 1000, 1) if self.count else 0.0,
+            "p50_ms": round(percentile(0.5), 1),
+            "p95_ms": round(percentile(0.95), 1),
+            "max_ms": round(self.max * 1000, 1)
+        }
+
+@dataclass
+class SpaceSaving:
+    """Приближенный top-K самых частых элементов (алгоритм Space-Saving) в фиксированной памяти"""
+    capacity: int
+    counts: Dict[str, int] = field(default_factory=dict)
+    errors: Dict[str, int] = field(default_factory=dict)
+    total: int = 0
+
+    def add(self, item: str, weight: int = 1) -> Optional[str]:
+        """Учитывает элемент; возвращает вытесненный элемент, если он был"""
+        self.total += weight
+        if item in self.counts:
+            self.counts[item] += weight
+            return None
+        if len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+            return None
+        # Новый элемент наследует счетчик самого редкого, счетчик становится его погрешностью
+        evicted = min(self.counts, key=self.counts.get)
+        min_count = self.counts.pop(evicted)
+        del self.errors[evicted]
+        self.counts[item] = min_count + weight
+        self.errors[item] = min_count
+        return evicted
+
+    def top(self, n: int) -> list:
+        ordered = sorted(self.counts.items(), key=lambda entry: entry[1], reverse=True)[:n]
+        return [{"item": item, "count": count, "error": self.errors[item]} for item, count in ordered]
+
+@dataclass
+class SizeHistogram:
+    """Распределение размеров значений по степеням двойки"""
+    count: int = 0
+    total: int = 0
+    max: int = 0
+    buckets: Dict[int, int] = field(default_factory=dict)
+
+    def record(self, size: int):
+        self.count += 1
+        self.total += size
+        self.max = max(self.max, size)
+        # 0 -> "<1", 1 -> "<2", 2..3 -> "<4", ...
+        bucket = 1 << size.bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_bytes": self.total // self.count if self.count else 0,
+            "max_bytes": self.max,
+            # Ключ бакета — верхняя граница размера в байтах
+            "buckets": {f"<{bucket}": count for bucket, count in sorted(self.buckets.items())}
+        }
+
+@dataclass
+class ConnectionStats:
+    """Счетчики операций одного WebSocket соединения"""
+    username: str
+    connected_at: float = field(default_factory=time.monotonic)
+    ops: int = 0
+    ops_by_type: Dict[str, int] = field(default_factory=dict)
+    window_started: float = field(default_factory=time.monotonic)
+    window_ops: int = 0
+    previous_window_ops: int = 0
+
+    def roll_window(self, now: float):
+        """Переходит к текущему окну; окна без операций обнуляют счетчики"""
+        elapsed = now - self.window_started
+        if elapsed < PROFILE_RATE_WINDOW:
+            return
+        self.previous_window_ops = self.window_ops if elapsed < 2 * PROFILE_RATE_WINDOW else 0
+        self.window_started = now - elapsed % PROFILE_RATE_WINDOW
+        self.window_ops = 0
+
+    def recent_rate(self, now: float) -> float:
+        """Частота операций за последние PROFILE_RATE_WINDOW секунд (скользящее окно по двум счетчикам)"""
+        self.roll_window(now)
+        previous_weight = 1 - (now - self.window_started) / PROFILE_RATE_WINDOW
+        recent_ops = self.window_ops + self.previous_window_ops * previous_weight
+        # Молодое соединение делим на время жизни, чтобы всплеск был виден сразу
+        span = max(1.0, min(PROFILE_RATE_WINDOW, now - self.connected_at))
+        return recent_ops / span
+
+    def record(self, op: str, now: float):
+        self.ops += 1
+        self.ops_by_type[op] = self.ops_by_type.get(op, 0) + 1
+        self.roll_window(now)
+        self.window_ops += 1
+
+    def snapshot(self, now: float) -> dict:
+        elapsed = now - self.connected_at
+        return {
+            "username": self.username,
+            "connected_sec": round(elapsed),
+            "ops": self.ops,
+            "ops_by_type": dict(self.ops_by_type),
+            "avg_ops_per_sec": round(self.ops / max(1.0, elapsed), 3),
+            "recent_ops_per_sec": round(self.recent_rate(now), 3)
+        }
+
+@dataclass
+class AccessProfiler:
+    """Профиль нагрузки в памяти процесса: горячие пользователи и ключи, размеры значений, частота операций"""
+    capacity: int
+    users: SpaceSaving = None
+    keys: SpaceSaving = None
+    key_sizes: Dict[str, SizeHistogram] = field(default_factory=dict)
+    ops_by_type: Dict[str, int] = field(default_factory=dict)
+    connections: Dict[int, ConnectionStats] = field(default_factory=dict)
+    started_at: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        self.users = SpaceSaving(self.capacity)
+        self.keys = SpaceSaving(self.capacity)
+
+    def open_connection(self, username: str) -> ConnectionStats:
+        conn = ConnectionStats(username=username)
+        self.connections[id(conn)] = conn
+        return conn
+
+    def close_connection(self, conn: ConnectionStats):
+        self.connections.pop(id(conn), None)
+
+    def record(self, conn: ConnectionStats, username: str, op: str, storage_key: str, size: Optional[int]):
+        """Учитывает операцию с хранилищем; вызывается на каждый запрос, поэтому только O(1) работа в обычном случае"""
+        conn.record(op, time.monotonic())
+        self.ops_by_type[op] = self.ops_by_type.get(op, 0) + 1
+        self.users.add(username)
+        key = f"{username}/{storage_key}"
+        evicted = self.keys.add(key)
+        # Гистограммы размеров храним только для ключей, которые сейчас в top-K
+        if evicted is not None:
+            self.key_sizes.pop(evicted, None)
+        if size is not None:
+            self.key_sizes.setdefault(key, SizeHistogram()).record(size)
+
+    def snapshot(self, top: int = None) -> dict:
+        top = top or PROFILE_TOP_K
+        now = time.monotonic()
+        hot_keys = self.keys.top(top)
+        for entry in hot_keys:
+            histogram = self.key_sizes.get(entry["item"])
+            entry["sizes"] = histogram.snapshot() if histogram else None
+        connections = sorted(
+            (conn.snapshot(now) for conn in self.connections.values()),
+            key=lambda conn: conn["recent_ops_per_sec"],
+            reverse=True
+        )
+        return {
+            "uptime_sec": round(now - self.started_at),
+            "total_ops": self.users.total,
+            "ops_by_type": dict(self.ops_by_type),
+            "hot_users": self.users.top(top),
+            "hot_keys": hot_keys,
+            "connections": connections[:top]
+        }
+
 
 # CONFIG BEGIN
 
@@ -33,6 +273,18 @@ MYSQL_CONFIG = {
     'autocommit': True
 }
 
+# Хранение логов операций (operation_logs разбивается на дневные партиции)
+OPERATION_LOGS_PARTITIONING = os.getenv("OPERATION_LOGS_PARTITIONING", "true").lower() == "true"
+OPERATION_LOGS_RETENTION_DAYS = int(os.getenv("OPERATION_LOGS_RETENTION_DAYS", "30"))
+OPERATION_LOGS_PARTITIONS_AHEAD = int(os.getenv("OPERATION_LOGS_PARTITIONS_AHEAD", "3"))
+OPERATION_LOGS_ROLLUP = os.getenv("OPERATION_LOGS_ROLLUP", "true").lower() == "true"
+
+# Перевод существующей непартиционированной operation_logs на партиции (или флаг --migrate-operation-logs).
+# ALTER TABLE копирует всю таблицу и блокирует запись в нее, а сервер не принимает соединения
+# до окончания перевода: простой пропорционален размеру таблицы (на больших таблицах — десятки минут).
+# Запускайте один раз в окно обслуживания; новые таблицы создаются партиционированными сразу.
+OPERATION_LOGS_MIGRATE = os.getenv("OPERATION_LOGS_MIGRATE", "false").lower() == "true"
+
 # Кэш пользовательских сессий в памяти (token -> UserSession)
 user_sessions: Dict[str, UserSession] = {}
 
@@ -44,11 +296,53 @@ UINFO_API_URL = "https://dw.y-chain.net/rails/uinfo.php"
 USERNAME = "user" 
 PASSWORD = "****"
 
+# HTTP клиент API авторизации
+AUTH_POOL_LIMIT = int(os.getenv("AUTH_POOL_LIMIT", "100"))
+AUTH_POOL_LIMIT_PER_HOST = int(os.getenv("AUTH_POOL_LIMIT_PER_HOST", "20"))
+AUTH_DNS_CACHE_TTL = int(os.getenv("AUTH_DNS_CACHE_TTL", "300"))
+AUTH_KEEPALIVE_TIMEOUT = float(os.getenv("AUTH_KEEPALIVE_TIMEOUT", "30"))
+AUTH_CONNECT_TIMEOUT = float(os.getenv("AUTH_CONNECT_TIMEOUT", "3"))
+AUTH_REQUEST_TIMEOUT = float(os.getenv("AUTH_REQUEST_TIMEOUT", "5"))
+AUTH_LOGIN_TIMEOUT = float(os.getenv("AUTH_LOGIN_TIMEOUT", "10"))
+
+# Circuit breaker API авторизации (пока он открыт, токены проверяются по кэшу сессий)
+AUTH_BREAKER_FAILURE_THRESHOLD = int(os.getenv("AUTH_BREAKER_FAILURE_THRESHOLD", "5"))
+AUTH_BREAKER_RESET_TIMEOUT = float(os.getenv("AUTH_BREAKER_RESET_TIMEOUT", "30"))
+AUTH_SLOW_CALL_THRESHOLD = float(os.getenv("AUTH_SLOW_CALL_THRESHOLD", "2"))
+AUTH_IDENTITY_CACHE_TTL = float(os.getenv("AUTH_IDENTITY_CACHE_TTL", "3600"))
+
+# Профилирование нагрузки (горячие пользователи и ключи)
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "true").lower() == "true"
+PROFILE_CAPACITY = int(os.getenv("PROFILE_CAPACITY", "200"))
+PROFILE_TOP_K = int(os.getenv("PROFILE_TOP_K", "20"))
+PROFILE_RATE_WINDOW = float(os.getenv("PROFILE_RATE_WINDOW", "60"))
+PROFILE_DUMP_INTERVAL = int(os.getenv("PROFILE_DUMP_INTERVAL", "300"))
+PROFILE_DUMP_PATH = os.getenv("PROFILE_DUMP_PATH", "")
+
+# Пользователи, которым доступен снимок профиля через WebSocket ({"type": "profile"})
+ADMIN_USERNAMES = [name for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name]
+
 # CONFIG END
 
 # Глобальная серверная сессия для API запросов
 server_session: Optional[aiohttp.ClientSession] = None
 
+# Текущий логин серверной сессии (общий для всех ожидающих)
+server_login_task: Optional[asyncio.Task] = None
+
+# Отложенное закрытие старых серверных сессий (ссылки держим, чтобы задачи не собрал GC)
+session_close_tasks: Set[asyncio.Task] = set()
+
+# Состояние и статистика API авторизации
+auth_breaker = CircuitBreaker(
+    failure_threshold=AUTH_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=AUTH_BREAKER_RESET_TIMEOUT
+)
+auth_stats = LatencyStats()
+
+# Профиль нагрузки
+profiler = AccessProfiler(capacity=PROFILE_CAPACITY)
+
 # Пул соединений MySQL
 mysql_pool: Optional[aiomysql.Pool] = None
 
@@ -142,16 +436,37 @@ async def init_database():
                 ''')
                 
                 # Таблица для логов операций
-                await cursor.execute('''
+                # created_at входит в первичный ключ, чтобы таблицу можно было партиционировать по времени;
+                # дневные партиции отщепляются от p_future при обслуживании
+                partitioning = '''
+                    PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+                        PARTITION p_future VALUES LESS THAN MAXVALUE
+                    )
+                ''' if OPERATION_LOGS_PARTITIONING else ""
+                await cursor.execute(f'''
                     CREATE TABLE IF NOT EXISTS operation_logs (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        id INT AUTO_INCREMENT,
                         username VARCHAR(255),
                         operation VARCHAR(50),
                         storage_key VARCHAR(255),
                         value MEDIUMTEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (id, created_at),
                         INDEX idx_username_created (username, created_at)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                    {partitioning}
+                ''')
+                
+                # Таблица агрегированных счетчиков операций (заполняется перед удалением старых партиций)
+                await cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS operation_logs_daily (
+                        day DATE NOT NULL,
+                        username VARCHAR(255) NOT NULL,
+                        operation VARCHAR(50) NOT NULL,
+                        ops_count INT NOT NULL,
+                        value_bytes BIGINT NOT NULL,
+                        PRIMARY KEY (day, username, operation)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
                 ''')
                 
                 # Проверяем таблицы
@@ -166,6 +481,125 @@ async def init_database():
         print(f"[DB] MySQL initialization error: {e}")
         raise
 
+def partition_name(day: date) -> str:
+    """Имя дневной партиции operation_logs (pYYYYMMDD)"""
+    return f"p{day.strftime('%Y%m%d')}"
+
+def partition_day(name: str) -> Optional[date]:
+    """Дата дневной партиции по ее имени, None для служебных партиций"""
+    try:
+        return datetime.strptime(name, "p%Y%m%d").date()
+    except (TypeError, ValueError):
+        return None
+
+def partition_definition(day: date) -> str:
+    """Определение партиции с записями за указанный день"""
+    upper_bound = (day + timedelta(days=1)).strftime('%Y-%m-%d 00:00:00')
+    return f"PARTITION {partition_name(day)} VALUES LESS THAN (UNIX_TIMESTAMP('{upper_bound}'))"
+
+async def get_operation_logs_partitions(cursor) -> list:
+    """Возвращает партиции operation_logs как (имя, верхняя граница); пустой список, если таблица не партиционирована"""
+    await cursor.execute('''
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'operation_logs'
+        ORDER BY PARTITION_ORDINAL_POSITION
+    ''')
+    rows = await cursor.fetchall()
+    return [(row[0], row[1]) for row in rows if row[0]]
+
+async def migrate_operation_logs_partitioning(cursor, today: date, cutoff: date):
+    """Переводит operation_logs на партиционирование по created_at"""
+    print(f"[RETENTION] Converting operation_logs to partitioned table, this may take a while...")
+    # История делится на p_expired (старше срока хранения, удаляется этим же проходом обслуживания)
+    # и p_archive (до сегодняшнего дня), чтобы при нарезке дневных партиций из p_future
+    # не копировать таблицу второй раз
+    definitions = [f"PARTITION p_expired VALUES LESS THAN (UNIX_TIMESTAMP('{cutoff.strftime('%Y-%m-%d 00:00:00')}'))"]
+    if cutoff < today:
+        definitions.append(f"PARTITION p_archive VALUES LESS THAN (UNIX_TIMESTAMP('{today.strftime('%Y-%m-%d 00:00:00')}'))")
+    history = ",\n".join(definitions)
+    await cursor.execute(f'''
+        ALTER TABLE operation_logs
+            MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id, created_at)
+        PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+            {history},
+            PARTITION p_future VALUES LESS THAN MAXVALUE
+        )
+    ''')
+    print(f"[RETENTION] operation_logs is now partitioned")
+
+async def rollup_operation_logs_partition(cursor, name: str):
+    """Сохраняет дневные счетчики операций по пользователям из партиции перед ее удалением"""
+    # Границы партиций — полночь в часовом поясе MySQL, поэтому день целиком лежит
+    # в одной партиции и значения можно перезаписывать
+    await cursor.execute(f'''
+        INSERT INTO operation_logs_daily (day, username, operation, ops_count, value_bytes)
+        SELECT DATE(created_at), COALESCE(username, ''), COALESCE(operation, ''),
+               COUNT(*), COALESCE(SUM(LENGTH(value)), 0)
+        FROM operation_logs PARTITION ({name})
+        GROUP BY DATE(created_at), COALESCE(username, ''), COALESCE(operation, '')
+        ON DUPLICATE KEY UPDATE ops_count = VALUES(ops_count), value_bytes = VALUES(value_bytes)
+    ''')
+    print(f"[RETENTION] Rolled up partition {name}: {cursor.rowcount} rows affected")
+
+async def maintain_operation_logs_partitions():
+    """Создает партиции operation_logs наперед и удаляет партиции старше срока хранения"""
+    if not OPERATION_LOGS_PARTITIONING:
+        return
+    
+    try:
+        async with mysql_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                # Дату и границы берем у MySQL: партиции и DATE(created_at) считаются в его часовом поясе
+                await cursor.execute(
+                    "SELECT CURDATE(), CURDATE() - INTERVAL %s DAY, UNIX_TIMESTAMP(CURDATE() - INTERVAL %s DAY)",
+                    (OPERATION_LOGS_RETENTION_DAYS, OPERATION_LOGS_RETENTION_DAYS)
+                )
+                today, cutoff, cutoff_timestamp = await cursor.fetchone()
+                
+                partitions = await get_operation_logs_partitions(cursor)
+                if not partitions:
+                    if not OPERATION_LOGS_MIGRATE:
+                        print(f"[RETENTION] operation_logs is not partitioned, retention is inactive. "
+                              f"Set OPERATION_LOGS_MIGRATE=true or pass --migrate-operation-logs "
+                              f"to convert it (blocks the server while the table is copied)")
+                        return
+                    await migrate_operation_logs_partitioning(cursor, today, cutoff)
+                    partitions = await get_operation_logs_partitions(cursor)
+                
+                days = sorted(day for day in (partition_day(name) for name, _ in partitions) if day)
+                
+                # Создаем партиции наперед, отщепляя их от p_future
+                last_day = days[-1] if days else today - timedelta(days=1)
+                new_days = []
+                day = max(last_day + timedelta(days=1), today)
+                while day <= today + timedelta(days=OPERATION_LOGS_PARTITIONS_AHEAD):
+                    new_days.append(day)
+                    day += timedelta(days=1)
+                
+                if new_days:
+                    definitions = ",\n".join(partition_definition(day) for day in new_days)
+                    await cursor.execute(f'''
+                        ALTER TABLE operation_logs REORGANIZE PARTITION p_future INTO (
+                            {definitions},
+                            PARTITION p_future VALUES LESS THAN MAXVALUE
+                        )
+                    ''')
+                    print(f"[RETENTION] Created partitions: {[partition_name(day) for day in new_days]}")
+                
+                # Удаляем партиции (включая p_expired и p_archive), все записи которых старше срока хранения
+                for name, upper_bound in partitions:
+                    if name == "p_future" or int(upper_bound) > int(cutoff_timestamp):
+                        break
+                    if OPERATION_LOGS_ROLLUP:
+                        await rollup_operation_logs_partition(cursor, name)
+                    await cursor.execute(f"ALTER TABLE operation_logs DROP PARTITION {name}")
+                    print(f"[RETENTION] Dropped partition {name}")
+    
+    except Exception as e:
+        print(f"[RETENTION] Partition maintenance error: {e}")
+
 async def log_operation(username: str, operation: str, storage_key: str, value: str = None):
     """Логирует операцию в MySQL"""
     try:
@@ -250,78 +684,130 @@ async def delete_user_storage(username: str, storage_key: str) -> bool:
         print(f"[DB] Delete error: {e}")
         return False
 
-async def create_server_session() -> bool:
-    """Создает серверную сессию с аутентификацией"""
-    global server_session
-    
+def new_server_session() -> aiohttp.ClientSession:
+    """Создает HTTP сессию к API авторизации с настроенным пулом соединений"""
+    connector = aiohttp.TCPConnector(
+        limit=AUTH_POOL_LIMIT,
+        limit_per_host=AUTH_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=AUTH_DNS_CACHE_TTL,
+        keepalive_timeout=AUTH_KEEPALIVE_TIMEOUT
+    )
+    timeout = aiohttp.ClientTimeout(total=AUTH_REQUEST_TIMEOUT, connect=AUTH_CONNECT_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+async def close_session_later(session: aiohttp.ClientSession, delay: float):
+    """Закрывает старую сессию после того, как завершатся начатые на ней запросы"""
     try:
-        # Закрываем старую сессию, если существует
-        if server_session and not server_session.closed:
-            await server_session.close()
+        await asyncio.sleep(delay)
+    finally:
+        # Закрываем и при отмене задачи (остановка сервера)
+        if not session.closed:
+            await session.close()
+
+async def login_server_session(session: aiohttp.ClientSession) -> bool:
+    """Логинится в API от имени сервера и проверяет, что сессия работает"""
+    print(f"[SERVER] Logging in as {USERNAME}...")
+    
+    async with session.post(
+        AUTH_API_URL,
+        data={
+            "username": USERNAME,
+            "password": PASSWORD
+        },
+        timeout=aiohttp.ClientTimeout(total=AUTH_LOGIN_TIMEOUT, connect=AUTH_CONNECT_TIMEOUT)
+    ) as response:
+        response_text = await response.text()
+        print(f"[SERVER] Login response status: {response.status}")
         
-        print(f"[SERVER] Creating new session with login...")
+        if response.status != 200:
+            print(f"[SERVER] Login HTTP error: {response.status}")
+            return False
         
-        # Создаем новую сессию
-        server_session = aiohttp.ClientSession()
+        try:
+            data = json.loads(response_text)
+        except json.JSONDecodeError as e:
+            print(f"[SERVER] Failed to parse login response JSON: {e}")
+            return False
         
-        # Логинимся как Silent58
-        print(f"[SERVER] Logging in as {USERNAME}...")
+        if data.get("message") != "auth_success":
+            print(f"[SERVER] Login failed message: {data.get('message')}")
+            return False
         
-        async with server_session.post(
-            AUTH_API_URL,
-            data={
-                "username": USERNAME,
-                "password": PASSWORD
-            },
-            timeout=10
-        ) as response:
-            response_text = await response.text()
-            print(f"[SERVER] Login response status: {response.status}")
-            
-            if response.status == 200:
-                try:
-                    data = json.loads(response_text)
-                    
-                    if data.get("message") == "auth_success":
-                        print(f"[SERVER] Successfully logged in as {USERNAME}")
-                        
-                        # Проверяем, что сессия работает, запрашивая информацию о себе
-                        async with server_session.get(UINFO_API_URL, timeout=5) as test_response:
-                            test_response_text = await test_response.text()
-                            
-                            if test_response.status == 200:
-                                try:
-                                    test_data = json.loads(test_response_text)
-                                    
-                                    if test_data.get("message") == "user_info_success":
-                                        username_from_test = test_data['data']['user']['username']
-                                        print(f"[SERVER] Session confirmed for user: {username_from_test}")
-                                        return True
-                                    else:
-                                        print(f"[SERVER] Session test failed message: {test_data.get('message')}")
-                                        return False
-                                except json.JSONDecodeError as e:
-                                    print(f"[SERVER] Failed to parse test response JSON: {e}")
-                                    return False
-                            else:
-                                print(f"[SERVER] Session test HTTP error: {test_response.status}")
-                                return False
-                    else:
-                        print(f"[SERVER] Login failed message: {data.get('message')}")
-                        return False
-                except json.JSONDecodeError as e:
-                    print(f"[SERVER] Failed to parse login response JSON: {e}")
-                    return False
-            else:
-                print(f"[SERVER] Login HTTP error: {response.status}")
-                return False
-                
+        print(f"[SERVER] Successfully logged in as {USERNAME}")
+    
+    # Проверяем, что сессия работает, запрашивая информацию о себе
+    async with session.get(UINFO_API_URL) as test_response:
+        test_response_text = await test_response.text()
+        
+        if test_response.status != 200:
+            print(f"[SERVER] Session test HTTP error: {test_response.status}")
+            return False
+        
+        try:
+            test_data = json.loads(test_response_text)
+        except json.JSONDecodeError as e:
+            print(f"[SERVER] Failed to parse test response JSON: {e}")
+            return False
+        
+        if test_data.get("message") != "user_info_success":
+            print(f"[SERVER] Session test failed message: {test_data.get('message')}")
+            return False
+        
+        username_from_test = test_data['data']['user']['username']
+        print(f"[SERVER] Session confirmed for user: {username_from_test}")
+        return True
+
+async def create_server_session() -> bool:
+    """Создает серверную сессию с аутентификацией"""
+    global server_session
+    
+    print(f"[SERVER] Creating new session with login...")
+    
+    # Новая сессия подменяет старую только после успешного логина,
+    # чтобы не обрывать запросы, которые уже идут через старую
+    session = new_server_session()
+    try:
+        if not await login_server_session(session):
+            await session.close()
+            return False
     except Exception as e:
         print(f"[SERVER] Failed to create session: {e}")
-        if server_session and not server_session.closed:
-            await server_session.close()
-        server_session = None
+        await session.close()
         return False
+    
+    old_session = server_session
+    server_session = session
+    if old_session and not old_session.closed:
+        close_task = asyncio.create_task(close_session_later(old_session, AUTH_REQUEST_TIMEOUT))
+        session_close_tasks.add(close_task)
+        close_task.add_done_callback(session_close_tasks.discard)
+    return True
+
+async def refresh_server_session() -> bool:
+    """Перелогинивается, объединяя одновременные запросы в один логин"""
+    global server_login_task
+    
+    if server_login_task is None or server_login_task.done():
+        server_login_task = asyncio.create_task(create_server_session())
+    
+    # shield: отмена одного ожидающего не должна прерывать общий логин
+    return await asyncio.shield(server_login_task)
+
+async def relogin_server_session(stale_session: Optional[aiohttp.ClientSession]) -> bool:
+    """Перелогинивается, если сессию еще не обновил другой запрос"""
+    if server_session is not stale_session and server_session and not server_session.closed:
+        return True
+    return await refresh_server_session()
+
+def cached_identity(token: str, reason: str) -> Optional[str]:
+    """Возвращает username из кэша сессий, пока API авторизации недоступен"""
+    session = user_sessions.get(token)
+    if session and time.monotonic() - session.authenticated_at < AUTH_IDENTITY_CACHE_TTL:
+        print(f"[AUTH] {reason}, serving cached identity: {session.username}")
+        return session.username
+    
+    print(f"[AUTH] {reason}, no cached identity for token")
+    return None
 
 async def authenticate_token(token: str) -> Optional[str]:
     """Проверяет токен через API и возвращает username"""
@@ -329,67 +815,130 @@ async def authenticate_token(token: str) -> Optional[str]:
         print(f"[AUTH] Invalid token: {token}")
         return None
     
-    # Убеждаемся, что у нас есть валидная серверная сессия
-    if server_session is None or server_session.closed:
-        print(f"[AUTH] Server session not available, creating new one")
-        if not await create_server_session():
-            print(f"[AUTH] Failed to create server session")
-            return None
+    if not auth_breaker.allow_request():
+        return cached_identity(token, "Circuit breaker open")
     
+    # Любая ошибка засчитывается как сбой, иначе проба half_open зависнет навсегда;
+    # отмена (отключение клиента, остановка сервера) только освобождает пробу
     try:
+        return await request_token_username(token)
+    except Exception as e:
+        auth_breaker.record_failure()
+        print(f"[AUTH] Authentication error: {e!r}")
+        return None
+    except BaseException:
+        auth_breaker.release()
+        raise
+
+async def request_token_username(token: str) -> Optional[str]:
+    """Запрашивает username по токену у API, при необходимости перелогиниваясь один раз"""
+    # Не больше одного перелогина на запрос
+    for attempt in range(2):
+        session = server_session
+        
+        # Убеждаемся, что у нас есть валидная серверная сессия
+        if session is None or session.closed:
+            print(f"[AUTH] Server session not available, creating new one")
+            if not await relogin_server_session(session):
+                print(f"[AUTH] Failed to create server session")
+                auth_breaker.record_failure()
+                return cached_identity(token, "Auth API unavailable")
+            session = server_session
+        
         print(f"[AUTH] Requesting user info for token: {token}")
+        started = time.monotonic()
+        
+        try:
+            # Используем серверную сессию с куками для запроса информации о пользователе
+            async with session.get(UINFO_API_URL, params={"token": token}) as response:
+                response_text = await response.text()
+                status = response.status
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            auth_stats.record(time.monotonic() - started, ok=False)
+            auth_breaker.record_failure()
+            print(f"[AUTH] Request failed: {e!r}")
+            return cached_identity(token, "Auth API request failed")
         
-        # Используем серверную сессию с куками для запроса информации о пользователе
-        async with server_session.get(
-            UINFO_API_URL, 
-            params={"token": token},
-            timeout=5
-        ) as response:
-            response_text = await response.text()
-            print(f"[AUTH] Response status: {response.status}")
+        latency = time.monotonic() - started
+        print(f"[AUTH] Response status: {status} ({latency * 1000:.0f} ms)")
+        
+        if status == 401 or status >= 500:
+            auth_stats.record(latency, ok=False)
+        else:
+            auth_stats.record(latency, ok=True)
+        
+        if status >= 500:
+            auth_breaker.record_failure()
+            print(f"[AUTH] HTTP error: {status}")
+            return cached_identity(token, "Auth API error")
+        
+        data = None
+        if status == 200:
+            try:
+                data = json.loads(response_text)
+            except json.JSONDecodeError as e:
+                print(f"[AUTH] Failed to parse response JSON: {e}")
+        
+        # Если сессия истекла, пробуем перелогиниться; исход для circuit breaker
+        # известен только после перелогина
+        if attempt == 0:
+            needs_relogin = False
+            if status == 401:
+                print(f"[AUTH] HTTP error: {status}")
+                print("[AUTH] Session expired (401), re-logging in...")
+                needs_relogin = True
+            elif isinstance(data, dict) and data.get("message") in ["authentication_failed", "user_not_found"]:
+                print(f"[AUTH] API returned error message: {data.get('message')}")
+                print("[AUTH] Session may be expired, trying to re-login...")
+                needs_relogin = True
             
-            if response.status == 200:
-                try:
-                    data = json.loads(response_text)
-                    
-                    if data.get("message") == "user_info_success":
-                        username = data["data"]["user"]["username"]
-                        print(f"[AUTH] User authenticated: {username}")
-                        
-                        # Сохраняем сессию в памяти
-                        user_sessions[token] = UserSession(token=token, username=username)
-                        return username
-                    else:
-                        print(f"[AUTH] API returned error message: {data.get('message')}")
-                        
-                        # Если ошибка аутентификации, пробуем перелогиниться
-                        if data.get("message") in ["authentication_failed", "user_not_found"]:
-                            print("[AUTH] Session may be expired, trying to re-login...")
-                            if await create_server_session():
-                                print("[AUTH] Re-login successful, retrying token authentication")
-                                # Повторяем запрос с обновленной сессией
-                                return await authenticate_token(token)
-                except json.JSONDecodeError as e:
-                    print(f"[AUTH] Failed to parse response JSON: {e}")
-                    return None
-            else:
-                print(f"[AUTH] HTTP error: {response.status}")
-                # Если 401, пробуем перелогиниться
-                if response.status == 401:
-                    print("[AUTH] Session expired (401), re-logging in...")
-                    if await create_server_session():
-                        print("[AUTH] Re-login successful, retrying token authentication")
-                        # Повторяем запрос с обновленной сессией
-                        return await authenticate_token(token)
-                return None
-    
-    except asyncio.TimeoutError:
-        print("[AUTH] Request timeout")
-    except Exception as e:
-        print(f"[AUTH] Authentication error: {e}")
+            if needs_relogin:
+                if await relogin_server_session(session):
+                    print("[AUTH] Re-login successful, retrying token authentication")
+                    continue
+                auth_breaker.record_failure()
+                return cached_identity(token, "Re-login failed")
+        
+        # Медленные ответы тоже считаются сбоем для circuit breaker
+        if latency > AUTH_SLOW_CALL_THRESHOLD:
+            auth_breaker.record_failure()
+        else:
+            auth_breaker.record_success()
+        
+        if status != 200:
+            print(f"[AUTH] HTTP error: {status}")
+            return None
+        
+        if data is None:
+            return None
+        
+        if data.get("message") == "user_info_success":
+            username = data["data"]["user"]["username"]
+            print(f"[AUTH] User authenticated: {username}")
+            
+            # Сохраняем сессию в памяти
+            user_sessions[token] = UserSession(token=token, username=username)
+            return username
+        
+        print(f"[AUTH] API returned error message: {data.get('message')}")
+        return None
     
     return None
 
+async def reject_expired_session(websocket, token: str, response: dict) -> bool:
+    """Если токен больше не действителен, отправляет ошибку и закрывает соединение"""
+    if token in user_sessions:
+        return False
+    
+    response.update({
+        "error": "Session expired, please reload",
+        "errorName": "SecurityError"
+    })
+    print(f"[WS] Session expired for token: {token}")
+    await websocket.send(json.dumps(response))
+    await websocket.close()
+    return True
+
 async def handler(websocket, path):
     """Обработчик WebSocket соединений"""
     # Разбор query-string для получения токена
@@ -416,138 +965,170 @@ async def handler(websocket, path):
 
     print(f"[WS] User {username} connected successfully")
     
+    # Учет операций соединения для профиля нагрузки
+    conn_stats = profiler.open_connection(username) if PROFILE_ENABLED else None
+    
     # Основной цикл обработки сообщений
-    async for message in websocket:
-        print(f"[WS] Received message from {username}: {message}")
-        
-        try:
-            data = json.loads(message)
-            
-            # Обработка keepalive сообщений
-            if data.get("type") == "keepalive":
-                print(f"[WS] Received keepalive from {username}")
-                # Отправляем keepalive ответ
-                keepalive_response = {
-                    "type": "keepalive_response",
-                    "timestamp": data.get("timestamp"),
-                    "server_time": int(datetime.now().timestamp() * 1000)
-                }
-                await websocket.send(json.dumps(keepalive_response))
-                continue
-            
-            request_id = data.get("id")
-            op = data.get("op")
-            storage_key = data.get("key")
-            value = data.get("value")
-            
-            print(f"[WS] Parsed data: id={request_id}, op={op}, storage_key={storage_key}")
+    try:
+        async for message in websocket:
+            print(f"[WS] Received message from {username}: {message}")
             
-            if not request_id:
-                print(f"[WS] No request ID, ignoring message")
-                continue
-
-            # Валидация операции
-            if op not in ["put", "get", "delete"]:
-                response = {
-                    "id": request_id,
-                    "error": f"Unknown operation: {op}",
-                    "errorName": "DataError"
-                }
-                print(f"[WS] Invalid operation: {op}")
-                await websocket.send(json.dumps(response))
-                continue
-
-            # Проверяем, активна ли еще сессия пользователя
-            if token not in user_sessions:
-                # Токен больше не действителен
-                response = {
-                    "id": request_id,
-                    "error": "Session expired, please reload",
-                    "errorName": "SecurityError"
-                }
-                print(f"[WS] Session expired for token: {token}")
-                await websocket.send(json.dumps(response))
-                await websocket.close()
-                return
+            try:
+                data = json.loads(message)
+                
+                # Обработка keepalive сообщений
+                if data.get("type") == "keepalive":
+                    print(f"[WS] Received keepalive from {username}")
+                    # Отправляем keepalive ответ
+                    keepalive_response = {
+                        "type": "keepalive_response",
+                        "timestamp": data.get("timestamp"),
+                        "server_time": int(datetime.now().timestamp() * 1000)
+                    }
+                    await websocket.send(json.dumps(keepalive_response))
+                    continue
+                
+                # Снимок профиля нагрузки (только для администраторов)
+                if data.get("type") == "profile":
+                    # Проверяем, активна ли еще сессия пользователя
+                    if await reject_expired_session(websocket, token, {"type": "profile_response"}):
+                        return
+                    
+                    if username not in ADMIN_USERNAMES:
+                        profile_response = {
+                            "type": "profile_response",
+                            "error": "Not allowed",
+                            "errorName": "SecurityError"
+                        }
+                        print(f"[WS] Profile request denied for {username}")
+                    elif not PROFILE_ENABLED:
+                        profile_response = {
+                            "type": "profile_response",
+                            "error": "Profiling disabled",
+                            "errorName": "NotSupportedError"
+                        }
+                    else:
+                        top = data.get("top")
+                        profile_response = {
+                            "type": "profile_response",
+                            "profile": profiler.snapshot(top if isinstance(top, int) and top > 0 else None)
+                        }
+                    await websocket.send(json.dumps(profile_response))
+                    continue
+                
+                request_id = data.get("id")
+                op = data.get("op")
+                storage_key = data.get("key")
+                value = data.get("value")
+                
+                print(f"[WS] Parsed data: id={request_id}, op={op}, storage_key={storage_key}")
+                
+                if not request_id:
+                    print(f"[WS] No request ID, ignoring message")
+                    continue
 
-            # Выполнение операции
-            if op == "put":
-                if value is None:
+                # Валидация операции
+                if op not in ["put", "get", "delete"]:
                     response = {
                         "id": request_id,
-                        "error": "No value provided for put",
+                        "error": f"Unknown operation: {op}",
                         "errorName": "DataError"
                     }
-                    print(f"[WS] No value provided for put operation")
-                else:
-                    # Сохраняем как JSON строку
-                    value_str = json.dumps(value)
-                    success = await set_user_storage(username, storage_key, value_str)
-                    if success:
-                        response = {"id": request_id, "result": storage_key}
-                        print(f"[WS] Put operation successful for {username}, storage_key: {storage_key}")
-                    else:
+                    print(f"[WS] Invalid operation: {op}")
+                    await websocket.send(json.dumps(response))
+                    continue
+
+                # Проверяем, активна ли еще сессия пользователя
+                if await reject_expired_session(websocket, token, {"id": request_id}):
+                    return
+
+                # Выполнение операции
+                value_size = None
+                if op == "put":
+                    if value is None:
                         response = {
                             "id": request_id,
-                            "error": "Database write failed",
-                            "errorName": "UnknownError"
+                            "error": "No value provided for put",
+                            "errorName": "DataError"
                         }
-                        print(f"[WS] Put operation failed for {username}, storage_key: {storage_key}")
-
-            elif op == "get":
-                value_str = await get_user_storage(username, storage_key)
-                if value_str is not None:
-                    # Возвращаем уже распаршенный JSON
-                    try:
-                        value_obj = json.loads(value_str)
-                        response = {"id": request_id, "result": value_obj}
-                        print(f"[WS] Get operation successful for {username}, storage_key: {storage_key}")
-                    except:
+                        print(f"[WS] No value provided for put operation")
+                    else:
+                        # Сохраняем как JSON строку
+                        value_str = json.dumps(value)
+                        value_size = len(value_str)
+                        success = await set_user_storage(username, storage_key, value_str)
+                        if success:
+                            response = {"id": request_id, "result": storage_key}
+                            print(f"[WS] Put operation successful for {username}, storage_key: {storage_key}")
+                        else:
+                            response = {
+                                "id": request_id,
+                                "error": "Database write failed",
+                                "errorName": "UnknownError"
+                            }
+                            print(f"[WS] Put operation failed for {username}, storage_key: {storage_key}")
+
+                elif op == "get":
+                    value_str = await get_user_storage(username, storage_key)
+                    if value_str is not None:
+                        value_size = len(value_str)
+                        # Возвращаем уже распаршенный JSON
+                        try:
+                            value_obj = json.loads(value_str)
+                            response = {"id": request_id, "result": value_obj}
+                            print(f"[WS] Get operation successful for {username}, storage_key: {storage_key}")
+                        except:
+                            response = {
+                                "id": request_id,
+                                "error": "Data corruption",
+                                "errorName": "DataError"
+                            }
+                            print(f"[WS] Data corruption for {username}, storage_key: {storage_key}")
+                    else:
+                        # Возвращаем null для несуществующих ключей (как IndexedDB)
+                        response = {"id": request_id, "result": None}
+                        print(f"[WS] Get operation returned null for {username}, storage_key: {storage_key}")
+
+                elif op == "delete":
+                    success = await delete_user_storage(username, storage_key)
+                    if success:
+                        # IDB delete возвращает undefined, но мы вернем null для совместимости
+                        response = {"id": request_id, "result": None}
+                        print(f"[WS] Delete operation successful for {username}, storage_key: {storage_key}")
+                    else:
                         response = {
                             "id": request_id,
-                            "error": "Data corruption",
-                            "errorName": "DataError"
+                            "error": "Delete operation failed",
+                            "errorName": "UnknownError"
                         }
-                        print(f"[WS] Data corruption for {username}, storage_key: {storage_key}")
-                else:
-                    # Возвращаем null для несуществующих ключей (как IndexedDB)
-                    response = {"id": request_id, "result": None}
-                    print(f"[WS] Get operation returned null for {username}, storage_key: {storage_key}")
-
-            elif op == "delete":
-                success = await delete_user_storage(username, storage_key)
-                if success:
-                    # IDB delete возвращает undefined, но мы вернем null для совместимости
-                    response = {"id": request_id, "result": None}
-                    print(f"[WS] Delete operation successful for {username}, storage_key: {storage_key}")
-                else:
-                    response = {
-                        "id": request_id,
-                        "error": "Delete operation failed",
-                        "errorName": "UnknownError"
-                    }
-                    print(f"[WS] Delete operation failed for {username}, storage_key: {storage_key}")
+                        print(f"[WS] Delete operation failed for {username}, storage_key: {storage_key}")
 
-            # Отправляем ответ
-            print(f"[WS] Sending response")
-            await websocket.send(json.dumps(response))
+                if PROFILE_ENABLED:
+                    profiler.record(conn_stats, username, op, storage_key, value_size)
+                
+                # Отправляем ответ
+                print(f"[WS] Sending response")
+                await websocket.send(json.dumps(response))
 
-        except json.JSONDecodeError as e:
-            response = {
-                "id": data.get("id", 0) if isinstance(data, dict) else 0,
-                "error": "Invalid JSON",
-                "errorName": "SyntaxError"
-            }
-            print(f"[WS] JSON decode error: {e}")
-            await websocket.send(json.dumps(response))
-        except Exception as e:
-            print(f"[WS] Unexpected error: {e}")
-            response = {
-                "id": data.get("id", 0) if isinstance(data, dict) else 0,
-                "error": str(e),
-                "errorName": "UnknownError"
-            }
-            await websocket.send(json.dumps(response))
+            except json.JSONDecodeError as e:
+                response = {
+                    "id": data.get("id", 0) if isinstance(data, dict) else 0,
+                    "error": "Invalid JSON",
+                    "errorName": "SyntaxError"
+                }
+                print(f"[WS] JSON decode error: {e}")
+                await websocket.send(json.dumps(response))
+            except Exception as e:
+                print(f"[WS] Unexpected error: {e}")
+                response = {
+                    "id": data.get("id", 0) if isinstance(data, dict) else 0,
+                    "error": str(e),
+                    "errorName": "UnknownError"
+                }
+                await websocket.send(json.dumps(response))
+    finally:
+        if conn_stats:
+            profiler.close_connection(conn_stats)
 
 async def periodic_session_refresh():
     """Периодическое обновление серверной сессии"""
@@ -556,7 +1137,7 @@ async def periodic_session_refresh():
         
         try:
             print("[SERVER] Periodic session refresh...")
-            await create_server_session()
+            await refresh_server_session()
         except Exception as e:
             print(f"[SERVER] Failed to refresh session: {e}")
 
@@ -574,6 +1155,7 @@ async def cleanup_session():
             print(f"[CLEANUP] Active user sessions: {len(user_sessions)}")
             if user_sessions:
                 print(f"[CLEANUP] Users: {[session.username for session in user_sessions.values()]}")
+            print(f"[AUTH] Breaker: {auth_breaker.state}, latency: {auth_stats.snapshot()}")
         except Exception as e:
             print(f"[CLEANUP] Error: {e}")
 
@@ -595,6 +1177,34 @@ async def database_health_check():
         except Exception as e:
             print(f"[DB] Health check error: {e}")
 
+async def operation_logs_maintenance():
+    """Периодическое обслуживание партиций operation_logs"""
+    while True:
+        await asyncio.sleep(3600)  # Проверяем каждый час
+        await maintain_operation_logs_partitions()
+
+async def profile_dump():
+    """Периодический вывод профиля нагрузки в лог и (опционально) в JSON файл"""
+    while True:
+        await asyncio.sleep(PROFILE_DUMP_INTERVAL)
+        
+        try:
+            snapshot = profiler.snapshot()
+            top_users = [(entry["item"], entry["count"]) for entry in snapshot["hot_users"][:5]]
+            top_keys = [(entry["item"], entry["count"]) for entry in snapshot["hot_keys"][:5]]
+            print(f"[PROFILE] Total ops: {snapshot['total_ops']}, by type: {snapshot['ops_by_type']}")
+            print(f"[PROFILE] Hot users: {top_users}")
+            print(f"[PROFILE] Hot keys: {top_keys}")
+            
+            if PROFILE_DUMP_PATH:
+                # Пишем во временный файл и переименовываем, чтобы читатели не видели частичный JSON
+                tmp_path = f"{PROFILE_DUMP_PATH}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, PROFILE_DUMP_PATH)
+        except Exception as e:
+            print(f"[PROFILE] Dump error: {e}")
+
 async def main():
     """Основная функция сервера"""
     print("[APP] Remote Storage Server starting...")
@@ -625,6 +1235,10 @@ async def main():
         await close_mysql_pool()
         return
     
+    # Готовим партиции логов операций до приема соединений
+    print(f"[APP] Operation logs retention: {OPERATION_LOGS_RETENTION_DAYS} days, partitioning: {OPERATION_LOGS_PARTITIONING}")
+    await maintain_operation_logs_partitions()
+    
     # Создаем серверную сессию с аутентификацией
     print("[APP] Initializing server session...")
     if not await create_server_session():
@@ -640,6 +1254,8 @@ async def main():
     refresh_task = asyncio.create_task(periodic_session_refresh())
     cleanup_task = asyncio.create_task(cleanup_session())
     health_task = asyncio.create_task(database_health_check())
+    retention_task = asyncio.create_task(operation_logs_maintenance())
+    profile_task = asyncio.create_task(profile_dump()) if PROFILE_ENABLED else None
     
     try:
         # Настраиваем WebSocket сервер с SSL если нужно
@@ -665,8 +1281,14 @@ async def main():
         refresh_task.cancel()
         cleanup_task.cancel()
         health_task.cancel()
+        retention_task.cancel()
+        if profile_task:
+            profile_task.cancel()
         
-        # Закрываем серверную сессию
+        # Закрываем серверную сессию и старые сессии, ожидающие закрытия
+        for close_task in list(session_close_tasks):
+            close_task.cancel()
+        await asyncio.gather(*session_close_tasks, return_exceptions=True)
         if server_session and not server_session.closed:
             await server_session.close()
         
@@ -686,6 +1308,8 @@ if __name__ == "__main__":
     parser.add_argument("--ssl", action="store_true", help="Enable SSL")
     parser.add_argument("--cert", type=str, help="SSL certificate path")
     parser.add_argument("--key", type=str, help="SSL private key path")
+    parser.add_argument("--migrate-operation-logs", action="store_true",
+                        help="Convert existing operation_logs to partitions at startup (blocks until the table is copied)")
     args = parser.parse_args()
     
     # Обновляем конфигурацию SSL из аргументов командной строки
@@ -695,6 +1319,8 @@ if __name__ == "__main__":
         SSL_CERT_PATH = args.cert
     if args.key:
         SSL_KEY_PATH = args.key
+    if args.migrate_operation_logs:
+        OPERATION_LOGS_MIGRATE = True
     
     try:
         asyncio.run(main())